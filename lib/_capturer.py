@@ -0,0 +1,57 @@
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import dxcam
+except ImportError:
+    dxcam = None
+
+# A module logger, since create() runs at import time, before the script configures the root logger
+_log = logging.getLogger(__name__)
+
+
+class DXGICapturer:
+    def __init__(self, region: Tuple[int, int, int, int]):
+        """
+        Capture a region of the screen with DXGI Desktop Duplication. Requires the dxcam package.
+        :param region: The region to capture, in the format (left, top, right, bottom)
+        :raises RuntimeError: If dxcam is not installed or the duplication could not be created
+        """
+        if dxcam is None:
+            raise RuntimeError('dxcam is not installed')
+        self.region: Tuple[int, int, int, int] = region
+        try:
+            self._camera = dxcam.create(output_color='BGRA')
+        except Exception as e:
+            raise RuntimeError('Unable to create a DXGI output duplication') from e
+        if self._camera is None:
+            raise RuntimeError('Unable to create a DXGI output duplication')
+
+    def grab(self) -> Optional[np.ndarray]:
+        """
+        Grab the latest frame of the region
+        :return: An array of shape (height, width, 4) in BGRA order,
+                 or None if there is no new frame since the last grab or the grab failed
+        """
+        try:
+            return self._camera.grab(region=self.region)
+        except Exception as e:  # e.g. the duplication was lost to the lock screen or a mode switch
+            _log.debug('DXGI grab failed, falling back to GDI')
+            _log.debug(e)
+            return None
+
+
+def create(region: Tuple[int, int, int, int]) -> Optional[DXGICapturer]:
+    """
+    Try to create a DXGI capturer
+    :param region: The region to capture, in the format (left, top, right, bottom)
+    :return: A DXGICapturer, or None if DXGI capture is unavailable
+    """
+    try:
+        return DXGICapturer(region)
+    except RuntimeError as e:
+        _log.info('DXGI capture unavailable, falling back to GDI')
+        _log.debug(e.__cause__ or e)
+        return None
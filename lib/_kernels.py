@@ -0,0 +1,118 @@
+import logging
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# A module logger, since logging through the root logger at import time would configure it before the script does
+_log = logging.getLogger(__name__)
+
+if numba is not None:
+    _jit = numba.njit(cache=True, boundscheck=False)
+else:
+    def _jit(func):
+        return func
+
+# The even and odd bytes of a packed pixel are split into two words of 16-bit lanes, one channel per lane.
+# Setting bit 8 of every lane before a subtraction leaves it set only if the lane did not borrow.
+_LANES = 0x00FF00FF
+_GUARD = 0x01000100
+
+
+def pack_bounds(lo: np.ndarray, hi: np.ndarray):
+    """
+    Pack per-channel bounds into the format expected by range_matches
+    :param lo: The inclusive lower bounds, as a uint8 array in the format (B, G, R)
+    :param hi: The inclusive upper bounds, as a uint8 array in the format (B, G, R)
+    :return: A tuple (lo32, hi32) of packed bounds in the byte format 0xAARRGGBB. Alpha is unbounded
+    """
+    lo32 = int(lo[0]) | int(lo[1]) << 8 | int(lo[2]) << 16
+    hi32 = int(hi[0]) | int(hi[1]) << 8 | int(hi[2]) << 16 | 0xff << 24
+    return np.uint32(lo32), np.uint32(hi32)
+
+
+@_jit
+def _swar_in_range(pixels, lo32, hi32):
+    """
+    Branchless check that every channel of packed pixels is within packed inclusive bounds.
+    Works on a single pixel or element-wise on an array of pixels
+    :return: _GUARD where the pixel is within the bounds, any other value otherwise
+    """
+    even = pixels & _LANES
+    odd = (pixels >> 8) & _LANES
+    return (((even | _GUARD) - (lo32 & _LANES))
+            & (((hi32 & _LANES) | _GUARD) - even)
+            & ((odd | _GUARD) - ((lo32 >> 8) & _LANES))
+            & ((((hi32 >> 8) & _LANES) | _GUARD) - odd)
+            & _GUARD)
+
+
+def _range_matches_numpy(pixels: np.ndarray, lo32: np.uint32, hi32: np.uint32, max_errors: int) -> bool:
+    """
+    Check that no more than max_errors pixels have any color value outside of the given bounds
+    :param pixels: A uint32 array of packed pixels in the byte format 0xAARRGGBB
+    :param lo32: The inclusive lower bounds, packed by pack_bounds
+    :param hi32: The inclusive upper bounds, packed by pack_bounds
+    :param max_errors: The number of pixels allowed outside of the bounds
+    :return: True if at most max_errors pixels are outside of the bounds, false otherwise
+    """
+    return int(np.count_nonzero(_swar_in_range(pixels, lo32, hi32) != _GUARD)) <= max_errors
+
+
+def _greyscale_matches_numpy(pixels: np.ndarray, tolerance: int, max_errors: int) -> bool:
+    """
+    Check that no more than max_errors pixels are not some shade of grey, given a tolerance level
+    :param pixels: A uint32 array of packed pixels in the byte format 0xAARRGGBB
+    :param tolerance: The maximum distance that any R, G, or B value can be from any of the other two values
+    :param max_errors: The number of pixels allowed to not be greyscale
+    :return: True if at most max_errors pixels are not greyscale, false otherwise
+    """
+    channels = np.stack((pixels & 0xff, (pixels >> 8) & 0xff, (pixels >> 16) & 0xff), axis=1)
+    spread = channels.max(axis=1) - channels.min(axis=1)
+    return int(np.count_nonzero(spread > tolerance)) <= max_errors
+
+
+# The loop versions stop at the first pixel over the allowed number of errors
+
+
+def _range_matches_loop(pixels, lo32, hi32, max_errors):
+    lo = np.int64(lo32)
+    hi = np.int64(hi32)
+    errors = 0
+    for i in range(pixels.shape[0]):
+        if _swar_in_range(np.int64(pixels[i]), lo, hi) != _GUARD:
+            errors += 1
+            if errors > max_errors:
+                return False
+    return True
+
+
+def _greyscale_matches_loop(pixels, tolerance, max_errors):
+    errors = 0
+    for i in range(pixels.shape[0]):
+        p = np.int64(pixels[i])
+        r = (p >> 16) & 0xff
+        g = (p >> 8) & 0xff
+        b = p & 0xff
+        if max(r, g, b) - min(r, g, b) > tolerance:
+            errors += 1
+            if errors > max_errors:
+                return False
+    return True
+
+
+range_matches = _range_matches_numpy
+greyscale_matches = _greyscale_matches_numpy
+
+if numba is not None:
+    range_matches = _jit(_range_matches_loop)
+    greyscale_matches = _jit(_greyscale_matches_loop)
+
+    # Compile now so the first tick does not pay for it
+    _dummy = np.zeros(1, dtype=np.uint32)
+    range_matches(_dummy, np.uint32(0), np.uint32(0), 0)
+    greyscale_matches(_dummy, 0, 0)
+    _log.debug('Compiled probe kernels with numba')
@@ -1,117 +1,256 @@
 import sys
+import time
+import atexit
+import ctypes
+import threading
+from ctypes import wintypes
 from enum import Enum, auto
-from typing import Tuple
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
 
 try:
     from ctypes import windll
 except ImportError:
     sys.exit('This script is only compatible with Windows')
 
-_DC = windll.user32.GetDC(0)
+from lib import _capturer, _kernels
+
+_SRCCOPY = 0x00CC0020
+_BI_RGB = 0
+_DIB_RGB_COLORS = 0
+_EVENT_SYSTEM_FOREGROUND = 0x0003
+_WINEVENT_OUTOFCONTEXT = 0x0000
+_QS_ALLINPUT = 0x04FF
+_PM_REMOVE = 0x0001
+
+_Frame = np.ndarray
+
+
+def _prototype(func, argtypes: list, restype):
+    """
+    Declare the signature of a Win32 function so that ctypes does not have to guess how to marshal each call
+    :param func: The function, e.g. windll.gdi32.BitBlt
+    :param argtypes: The ctypes types of the arguments
+    :param restype: The ctypes type of the return value
+    :return: func
+    """
+    func.argtypes = argtypes
+    func.restype = restype
+    return func
+
+
+_GetDC = _prototype(windll.user32.GetDC, [wintypes.HWND], wintypes.HDC)
+_ReleaseDC = _prototype(windll.user32.ReleaseDC, [wintypes.HWND, wintypes.HDC], ctypes.c_int)
+_CreateCompatibleDC = _prototype(windll.gdi32.CreateCompatibleDC, [wintypes.HDC], wintypes.HDC)
+_DeleteDC = _prototype(windll.gdi32.DeleteDC, [wintypes.HDC], wintypes.BOOL)
+_CreateDIBSection = _prototype(windll.gdi32.CreateDIBSection,
+                               [wintypes.HDC, ctypes.c_void_p, wintypes.UINT, ctypes.POINTER(ctypes.c_void_p),
+                                wintypes.HANDLE, wintypes.DWORD],
+                               wintypes.HBITMAP)
+_SelectObject = _prototype(windll.gdi32.SelectObject, [wintypes.HDC, wintypes.HGDIOBJ], wintypes.HGDIOBJ)
+_DeleteObject = _prototype(windll.gdi32.DeleteObject, [wintypes.HGDIOBJ], wintypes.BOOL)
+_BitBlt = _prototype(windll.gdi32.BitBlt,
+                     [wintypes.HDC, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                      wintypes.HDC, ctypes.c_int, ctypes.c_int, wintypes.DWORD],
+                     wintypes.BOOL)
+
+_WinEventProc = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+                                   wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+_SetWinEventHook = _prototype(windll.user32.SetWinEventHook,
+                              [wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, _WinEventProc,
+                               wintypes.DWORD, wintypes.DWORD, wintypes.DWORD],
+                              wintypes.HANDLE)
+_UnhookWinEvent = _prototype(windll.user32.UnhookWinEvent, [wintypes.HANDLE], wintypes.BOOL)
+_MsgWaitForMultipleObjects = _prototype(windll.user32.MsgWaitForMultipleObjects,
+                                        [wintypes.DWORD, ctypes.POINTER(wintypes.HANDLE), wintypes.BOOL,
+                                         wintypes.DWORD, wintypes.DWORD],
+                                        wintypes.DWORD)
+_PeekMessageW = _prototype(windll.user32.PeekMessageW,
+                           [ctypes.POINTER(wintypes.MSG), wintypes.HWND, wintypes.UINT, wintypes.UINT, wintypes.UINT],
+                           wintypes.BOOL)
+_TranslateMessage = _prototype(windll.user32.TranslateMessage, [ctypes.POINTER(wintypes.MSG)], wintypes.BOOL)
+_DispatchMessageW = _prototype(windll.user32.DispatchMessageW, [ctypes.POINTER(wintypes.MSG)], wintypes.LPARAM)
+
+
+class _BITMAPINFOHEADER(ctypes.Structure):
+    _fields_ = [
+        ('biSize', ctypes.c_uint32),
+        ('biWidth', ctypes.c_int32),
+        ('biHeight', ctypes.c_int32),
+        ('biPlanes', ctypes.c_uint16),
+        ('biBitCount', ctypes.c_uint16),
+        ('biCompression', ctypes.c_uint32),
+        ('biSizeImage', ctypes.c_uint32),
+        ('biXPelsPerMeter', ctypes.c_int32),
+        ('biYPelsPerMeter', ctypes.c_int32),
+        ('biClrUsed', ctypes.c_uint32),
+        ('biClrImportant', ctypes.c_uint32),
+    ]
+
+
+class _BITMAPINFO(ctypes.Structure):
+    _fields_ = [
+        ('bmiHeader', _BITMAPINFOHEADER),
+        ('bmiColors', ctypes.c_uint32 * 1),
+    ]
+
 
 # TODO write calibration tool to accommodate different brightness settings
 
-_COLORS = {
-    'in_menu': (24, 113, 186),
-    'waiting': (175, 178, 185),
-    'character_select': (255, 255, 255),
+# Reference colors are stored as (B, G, R) to match the byte order of a packed 0xAARRGGBB pixel
+_REF_BGR = {
+    'in_menu': np.array([186, 113, 24], dtype=np.uint8),
+    'waiting': np.array([185, 178, 175], dtype=np.uint8),
+    'character_select': np.array([255, 255, 255], dtype=np.uint8),
+}
+
+# Range checks: each R, G, B value must be less than this distance from the reference color (exclusive).
+# Greyscale checks: the R, G, B values may differ from each other by at most this much (inclusive).
+_TOL = {
+    'in_menu': 2,
+    'waiting': 12,
+    'character_select': 3,
+}
+
+# Allow one error in the menus because the mouse may be covering one of the pixels
+_MAX_ERRORS = {
+    'in_menu': 1,
+    'waiting': 0,
+    'character_select': 1,
 }
 
-_PIXELS = {  # 2560x1440
-    'in_menu': [(1936, 49), (1936, 109), (1989, 49), (1976, 87)],
-    'waiting': [(2369, 1204), (2415, 1245), (2377, 1249), (2343, 1270)],
-    'character_select': [(2357, 250), (2402, 250), (2437, 250), (2483, 250)],
+# Probe sets that are checked for being any shade of grey rather than against their reference color
+_GREYSCALE = frozenset({'waiting'})
+
+# Inclusive (lo32, hi32) bounds of each reference color, precomputed from the tolerance and packed like a pixel
+_BOUNDS = {
+    name: _kernels.pack_bounds(np.clip(ref.astype(np.int16) - _TOL[name] + 1, 0, 255),
+                               np.clip(ref.astype(np.int16) + _TOL[name] - 1, 0, 255))
+    for name, ref in _REF_BGR.items()
+}
+
+_PIXELS_SOA = {  # 2560x1440, (xs, ys)
+    'in_menu': (np.array([1936, 1936, 1989, 1976], dtype=np.intp), np.array([49, 109, 49, 87], dtype=np.intp)),
+    'waiting': (np.array([2369, 2415, 2377, 2343], dtype=np.intp), np.array([1204, 1245, 1249, 1270], dtype=np.intp)),
+    'character_select': (np.array([2357, 2402, 2437, 2483], dtype=np.intp), np.array([250, 250, 250, 250], dtype=np.intp)),
 }
-# _PIXELS = {  # 1920x1080
-#     'in_menu': [(1490, 40), (1458, 74)],
-#     'waiting': [(1780, 904), (1810, 949), (1742, 942), (1782, 935)],
-#     'character_select': [(1766, 185), (1787, 193), (1815, 188), (1862, 192)],
+# _PIXELS_SOA = {  # 1920x1080, (xs, ys)
+#     'in_menu': (np.array([1490, 1458], dtype=np.intp), np.array([40, 74], dtype=np.intp)),
+#     'waiting': (np.array([1780, 1810, 1742, 1782], dtype=np.intp), np.array([904, 949, 942, 935], dtype=np.intp)),
+#     'character_select': (np.array([1766, 1787, 1815, 1862], dtype=np.intp), np.array([185, 193, 188, 192], dtype=np.intp)),
 # }
 
+# Bounding rect of every probe point. The whole rect is copied off the screen once per tick
+_X0 = int(min(xs.min() for xs, _ in _PIXELS_SOA.values()))
+_Y0 = int(min(ys.min() for _, ys in _PIXELS_SOA.values()))
+_WIDTH = int(max(xs.max() for xs, _ in _PIXELS_SOA.values())) - _X0 + 1
+_HEIGHT = int(max(ys.max() for _, ys in _PIXELS_SOA.values())) - _Y0 + 1
 
-def _get_pixel(x: int, y: int) -> int:
-    """
-    Get a pixel from the screen at (x, y)
-    :param x: The x-coordinate
-    :param y: The y-coordinate
-    :return: An integer in the byte format 0xBBGGRR
-    :note: These integers are calculated by taking the hex values of the RGB, then converting 0xBBGGRR to base 10
-    """
-    return windll.gdi32.GetPixel(_DC, x, y)
+_CAPTURER = _capturer.create((_X0, _Y0, _X0 + _WIDTH, _Y0 + _HEIGHT))
 
+_DC = _GetDC(None)
+_MEM_DC = _CreateCompatibleDC(_DC)
 
-def _pixel_to_rgb(pixel: int) -> Tuple[int, int, int]:
-    """
-    Convert a pixel in the byte format 0xBBGGRR to a tuple
-    :param pixel: The pixel to convert
-    :return: A tuple in the format (R, G, B)
-    """
-    r = pixel & 0xff
-    g = (pixel >> 8) & 0xff
-    b = (pixel >> 16) & 0xff
-    return r, g, b
+_BMI = _BITMAPINFO()
+_BMI.bmiHeader.biSize = ctypes.sizeof(_BITMAPINFOHEADER)
+_BMI.bmiHeader.biWidth = _WIDTH
+_BMI.bmiHeader.biHeight = -_HEIGHT  # Negative height makes the DIB top-down
+_BMI.bmiHeader.biPlanes = 1
+_BMI.bmiHeader.biBitCount = 32
+_BMI.bmiHeader.biCompression = _BI_RGB
 
+_BITS = ctypes.c_void_p()
+_DIB = _CreateDIBSection(_MEM_DC, ctypes.byref(_BMI), _DIB_RGB_COLORS, ctypes.byref(_BITS), None, 0)
+_OLD_BITMAP = _SelectObject(_MEM_DC, _DIB)
 
-def _in_acceptable_range(color_to_check: Tuple[int, int, int], color_ref: Tuple[int, int, int], distance: int) -> bool:
-    """
-    Check if each color value of a pixel is with a specified distance of the color values in the reference color
-    :param color_to_check: The color to perform the bounds check on
-    :param color_ref: The color to use as the reference
-    :param distance: The maximum allowed distance
-    :return: True if color_to_check is within the distance, false otherwise
-    """
-    if color_ref[0] - distance < color_to_check[0] < color_ref[0] + distance:
-        if color_ref[1] - distance < color_to_check[1] < color_ref[1] + distance:
-            if color_ref[2] - distance < color_to_check[2] < color_ref[2] + distance:
-                return True
-    return False
+
+@atexit.register
+def _release_handles():
+    unwatch_foreground()
+    _SelectObject(_MEM_DC, _OLD_BITMAP)
+    _DeleteObject(_DIB)
+    _DeleteDC(_MEM_DC)
+    _ReleaseDC(None, _DC)
+
+
+# A 32bpp DIB is laid out B, G, R, X, the same as a BGRA frame from DXGI
+_BUFFER = np.ctypeslib.as_array(ctypes.cast(_BITS, ctypes.POINTER(ctypes.c_uint8)), shape=(_HEIGHT, _WIDTH, 4))
 
 
-def _is_greyscale(color_to_check: Tuple[int, int, int], tolerance: int) -> bool:
+def _sample_all() -> _Frame:
     """
-    Check if a given pixel is some shade of grey, given a tolerance level
-    :param color_to_check: Tje color to check
-    :param tolerance: The maximum distance that any R, G, or B value can be from any of the other two values
-    :return: True if color_to_check is greyscale, false otherwise
+    Capture the bounding rect of all probe points from the screen.
+    DXGI is used if available; GDI is used otherwise, or if DXGI has no new frame.
+    :return: An array of shape (height, width, 4) in BGRA order
     """
-    greatest = max(color_to_check)
-    lo = greatest - tolerance
-    hi = greatest + tolerance
-    for c in color_to_check:
-        if not (lo <= c <= hi):
-            return False
-    return True
+    if _CAPTURER is not None:
+        frame = _CAPTURER.grab()
+        if frame is not None:
+            return frame
+    _BitBlt(_MEM_DC, 0, 0, _WIDTH, _HEIGHT, _DC, _X0, _Y0, _SRCCOPY)
+    return _BUFFER
+
+
+_foreground_changed = False
+_foreground_hook = None
+
+
+def _on_foreground(hook, event, hwnd, id_object, id_child, event_thread, event_time):
+    global _foreground_changed
+    _foreground_changed = True
+
 
+# Keep a reference to the callback so it is not garbage collected while the hook is installed
+_FOREGROUND_PROC = _WinEventProc(_on_foreground)
 
-def _in_menu() -> bool:
+
+def watch_foreground():
     """
-    Check if the Overwatch main menu is visible
-    :return: True if the main menu is visible, false otherwise
+    Start watching for foreground window changes (e.g. Overwatch gaining or losing focus).
+    Events are only delivered to the calling thread, while it is inside wait_for_foreground_change
     """
-    errors = len([pair for pair in _PIXELS['in_menu']
-                  if not _in_acceptable_range(_pixel_to_rgb(_get_pixel(*pair)), _COLORS['in_menu'], distance=2)])
-    # Allow one error because the mouse may be covering one of the pixels
-    return errors < 2
+    global _foreground_hook
+    if _foreground_hook is not None:
+        return
+    _foreground_hook = _SetWinEventHook(_EVENT_SYSTEM_FOREGROUND, _EVENT_SYSTEM_FOREGROUND, None,
+                                        _FOREGROUND_PROC, 0, 0, _WINEVENT_OUTOFCONTEXT)
 
 
-def _waiting() -> bool:
+def unwatch_foreground():
     """
-    Check if Check if Overwatch is loading the map, showing the 'VS' screen
-    :return: True if the game is in the waiting state, false otherwise
+    Stop watching for foreground window changes, if watching.
+    Windows only allows this from the thread that called watch_foreground
     """
-    errors = len([pair for pair in _PIXELS['waiting']
-                  if not _is_greyscale(_pixel_to_rgb(_get_pixel(*pair)), tolerance=12)])
-    return errors < 1
+    global _foreground_hook
+    if _foreground_hook is None:
+        return
+    _UnhookWinEvent(_foreground_hook)
+    _foreground_hook = None
 
 
-def _in_character_select() -> bool:
+def wait_for_foreground_change(timeout: float, stop: Optional[threading.Event] = None) -> bool:
     """
-    Check if the user is in the character select menu
-    :return: True if the character select menu is visible, false otherwise
+    Sleep until the foreground window changes, the timeout elapses or stop is set, whichever is first
+    :param timeout: The maximum number of seconds to sleep
+    :param stop: An event that ends the sleep early when set
+    :return: True if the foreground window changed, false otherwise
     """
-    errors = len([pair for pair in _PIXELS['character_select']
-                  if not _in_acceptable_range(_pixel_to_rgb(_get_pixel(*pair)), _COLORS['character_select'], distance=3)])
-    return errors < 2
+    global _foreground_changed
+    deadline = time.monotonic() + timeout
+    msg = wintypes.MSG()
+    while True:
+        if _foreground_changed:
+            _foreground_changed = False
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or (stop is not None and stop.is_set()):
+            return False
+        # Wait in short slices so Ctrl+C and stop are not held up for the whole timeout
+        _MsgWaitForMultipleObjects(0, None, False, int(min(remaining, 0.5) * 1000), _QS_ALLINPUT)
+        while _PeekMessageW(ctypes.byref(msg), None, 0, 0, _PM_REMOVE):
+            _TranslateMessage(ctypes.byref(msg))
+            _DispatchMessageW(ctypes.byref(msg))
 
 
 class GameState(Enum):
@@ -122,12 +261,61 @@ class GameState(Enum):
     CHARACTER_SELECT = auto()
 
 
-def get_state() -> GameState:
-    if _in_menu():
-        return GameState.IN_MENU
-    if _waiting():
-        return GameState.WAITING
-    if _in_character_select():
-        return GameState.CHARACTER_SELECT
+class _Probe(NamedTuple):
+    state: GameState
+    start: int  # Slice of the probe set's pixels within _ALL_XS / _ALL_YS
+    stop: int
+    greyscale: bool
+    lo32: np.uint32
+    hi32: np.uint32
+    tolerance: int
+    max_errors: int
+
+
+def _build_probes(order: List[Tuple[GameState, str]]) -> List[_Probe]:
+    """
+    Lay out the probe sets back to back so that all of their pixels can be gathered at once
+    :param order: (state, key in _PIXELS_SOA) pairs, in the order they should be checked
+    :return: A list of _Probe in the same order
+    """
+    probes = []
+    start = 0
+    for state, name in order:
+        stop = start + len(_PIXELS_SOA[name][0])
+        lo32, hi32 = _BOUNDS[name]
+        probes.append(_Probe(state, start, stop, name in _GREYSCALE, lo32, hi32, _TOL[name], _MAX_ERRORS[name]))
+        start = stop
+    return probes
+
+
+# The first probe set that matches decides the state
+_PROBE_ORDER = [
+    (GameState.IN_MENU, 'in_menu'),
+    (GameState.WAITING, 'waiting'),
+    (GameState.CHARACTER_SELECT, 'character_select'),
+]
+_ALL_PROBES = _build_probes(_PROBE_ORDER)
+# Every probe point, relative to the bounding rect, in the same order as _ALL_PROBES
+_ALL_XS = np.concatenate([_PIXELS_SOA[name][0] for _, name in _PROBE_ORDER]) - _X0
+_ALL_YS = np.concatenate([_PIXELS_SOA[name][1] for _, name in _PROBE_ORDER]) - _Y0
+
+
+def get_state(frame: Optional[_Frame] = None) -> GameState:
+    """
+    Detect which screen Overwatch is showing
+    :param frame: A frame returned by _sample_all. If not given, the screen is captured
+    :return: The state of the first probe set that matches, or GameState.UNKNOWN
+    """
+    if frame is None:
+        frame = _sample_all()
+    pixels = frame.view(np.uint32)[_ALL_YS, _ALL_XS, 0]
+    for probe in _ALL_PROBES:
+        probe_pixels = pixels[probe.start:probe.stop]
+        if probe.greyscale:
+            matches = _kernels.greyscale_matches(probe_pixels, probe.tolerance, probe.max_errors)
+        else:
+            matches = _kernels.range_matches(probe_pixels, probe.lo32, probe.hi32, probe.max_errors)
+        if matches:
+            return probe.state
 
     return GameState.UNKNOWN
@@ -1,10 +1,11 @@
 import logging
+import random
 import time
 import webbrowser
-import json
 from typing import List
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
 
@@ -42,6 +43,12 @@ class SpotifyClient:
         self.scopes: List[str] = scopes
         self.client_id: str = client_id
         self.client_secret: str = client_secret
+        self._auth_header: dict = {}
+
+        # Reuse connections so consecutive requests skip the TCP and TLS handshakes
+        self._session: requests.Session = requests.Session()
+        for host in ('https://api.spotify.com', 'https://accounts.spotify.com'):
+            self._session.mount(host, HTTPAdapter(pool_connections=2, pool_maxsize=4))
 
     def play(self):
         """
@@ -85,16 +92,20 @@ class SpotifyClient:
         if params is None:
             params = {}
         if self.authenticated:
-            res = requests.put(f'https://{base_url}', params=params, headers={'Authorization': f'Bearer {self.access_token}'})
-            if res.status_code == 202:
-                for tries in range(5):
-                    logging.warning('Spotify: device temporarily unavailable. Trying again in 5 seconds')
-                    time.sleep(5)
-                    res = requests.put(f'https://{base_url}', headers={'Authorization': f'Bearer {self.access_token}'})
-                    if res.status_code == 204:
-                        break
-                    if tries == 4:
-                        raise TimeoutError
+            put = self._session.put
+            url = f'https://{base_url}'
+            headers = self._auth_header
+            res = put(url, params=params, headers=headers)
+            tries = 0
+            while res.status_code == 202:
+                if tries == 5:
+                    raise TimeoutError
+                # Back off exponentially (0.5, 1, 2, 4, 8 seconds), with jitter
+                delay = 0.5 * 2 ** tries + random.random() * 0.25
+                logging.warning(f'Spotify: device temporarily unavailable. Trying again in {delay:.1f} seconds')
+                time.sleep(delay)
+                res = put(url, params=params, headers=headers)
+                tries += 1
 
             try:
                 self._parse_common_status(res, success_msg=success_msg, error_msg=error_msg)
@@ -103,6 +114,14 @@ class SpotifyClient:
         else:
             raise NotAuthenticatedError
 
+    def _set_access_token(self, access_token: str):
+        """
+        Store a new access token, along with the Authorization header sent with every API request
+        :param access_token: The access token returned by Spotify
+        """
+        self.access_token = access_token
+        self._auth_header = {'Authorization': f'Bearer {access_token}'}
+
     def _parse_common_status(self, res: requests.Response, success_msg: str, error_msg: str):
         """
         Parse the response sent from the majority of requests to the Spotify API
@@ -181,15 +200,15 @@ class SpotifyClient:
                 # 'client_secret': self.client_secret
             }
 
-            res = requests.post(f'https://{access_url}', data=data, auth=HTTPBasicAuth(self.client_id, self.client_secret))
+            res = self._session.post(f'https://{access_url}', data=data, auth=HTTPBasicAuth(self.client_id, self.client_secret))
             try:
                 assert res.status_code == 200
-                res_data = json.loads(res.text)
-                # assert res_data['scope'].split(' ') == self.scopes
+                res_data = res.json()
+                assert set(self.scopes) <= set(res_data.get('scope', '').split())
                 access_token = res_data['access_token']
                 refresh_token = res_data['refresh_token']
 
-                self.access_token = access_token
+                self._set_access_token(access_token)
                 self.refresh_token = refresh_token
                 self.authenticated = True
             except (KeyError, AssertionError) as e:
@@ -226,13 +245,13 @@ class SpotifyClient:
             'refresh_token': self.refresh_token
         }
 
-        res = requests.post(f'https://{base_url}', data=data, auth=HTTPBasicAuth(self.client_id, self.client_secret))
+        res = self._session.post(f'https://{base_url}', data=data, auth=HTTPBasicAuth(self.client_id, self.client_secret))
         try:
             assert res.status_code == 200
-            res_data = json.loads(res.text)
-            # assert res_data['scope'].split(' ') == self.scopes
+            res_data = res.json()
+            assert set(self.scopes) <= set(res_data.get('scope', '').split())
             access_token = res_data['access_token']
-            self.access_token = access_token
+            self._set_access_token(access_token)
             self.authenticated = True
         except (KeyError, AssertionError) as e:
             if res.status_code == 400:
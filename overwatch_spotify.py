@@ -1,10 +1,12 @@
-import time
 import logging
 import argparse
 import signal
 import sys
 import json
-from typing import Callable
+import queue
+import threading
+from functools import partial
+from typing import Callable, Dict, List, Tuple
 
 import lib.overwatch_lib as ol
 from lib.overwatch_lib import GameState
@@ -13,7 +15,11 @@ import lib.spotify_lib as sl
 
 CONFIG: dict = {}
 
-CFG_MAP: dict = {}
+# Event name -> [(action bound to its arguments, handled errors)], resolved once from CONFIG at startup
+EVENT_HANDLERS: Dict[str, List[Tuple[Callable, list]]] = {}
+
+POLL_INTERVAL = 0.2  # Seconds between checks right after a state change
+MAX_POLL_INTERVAL = 10.0  # Seconds between checks once the state has been stable for a while
 
 
 def handle_sigint(sig, frame):
@@ -22,11 +28,9 @@ def handle_sigint(sig, frame):
     exit(0)
 
 
-def try_spotify_function(func: Callable, handled_errors: list, func_args=None):
-    if func_args is None:
-        func_args = []
+def try_spotify_function(func: Callable, handled_errors: list):
     try:
-        func(*func_args)
+        func()
     except sl.InvalidTokenError:
         pass
     except sl.RequestFailedError as e:
@@ -38,17 +42,72 @@ def try_spotify_function(func: Callable, handled_errors: list, func_args=None):
 
 
 def handle_event(event_name: str):
-    global CFG_MAP
+    for func, handled_errors in EVENT_HANDLERS.get(event_name, []):
+        try_spotify_function(func, handled_errors=handled_errors)
 
-    for action in CONFIG[event_name]['actions']:
-        try:
-            action_name, *action_args = action
-            func = CFG_MAP[action_name]['func']
-            handled_errors = CFG_MAP[action_name]['handled_errors']
 
-            try_spotify_function(func, handled_errors=handled_errors, func_args=action_args)
-        except ValueError:  # A null event was passed (bad config)
-            pass
+def build_event_handlers(cfg_map: dict) -> Dict[str, List[Tuple[Callable, list]]]:
+    handlers = {}
+    for event_name, event_cfg in CONFIG.items():
+        handlers[event_name] = []
+        for action in event_cfg['actions']:
+            if not action:  # A null event was passed (bad config)
+                continue
+            action_name, *action_args = action
+            if action_name not in cfg_map:
+                logging.warning(f'Ignoring unknown action "{action_name}" for event "{event_name}"')
+                continue
+            func = partial(cfg_map[action_name]['func'], *action_args)
+            handlers[event_name].append((func, cfg_map[action_name]['handled_errors']))
+    return handlers
+
+
+def put_latest(q: queue.Queue, item):
+    """
+    Put an item on a bounded queue, dropping stale items if it is full so the consumer only sees the latest one
+    :param q: The queue
+    :param item: The item to put
+    """
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+def watch_state(states: queue.Queue, stop: threading.Event):
+    """
+    Poll the Overwatch state until stop is set and put every change on a queue. Meant to be run in its own thread
+    :param states: The queue to put new states on
+    :param stop: An event that stops polling when set
+    """
+    # The foreground hook delivers its events to, and can only be removed by, the thread that installed it
+    ol.watch_foreground()
+    try:
+        last_state = None
+        interval = POLL_INTERVAL
+        while not stop.is_set():
+            cur_state = ol.get_state()
+            if cur_state != last_state:
+                if last_state is None:
+                    logging.info(f'Overwatch: Initial state: {cur_state}')
+                else:
+                    logging.info(f'Overwatch: Changed state: {cur_state}')
+                last_state = cur_state
+                interval = POLL_INTERVAL
+                put_latest(states, cur_state)
+            else:
+                # Back off exponentially while the state is stable
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+            # Poll quickly again as soon as the focused window changes
+            if ol.wait_for_foreground_change(interval, stop):
+                interval = POLL_INTERVAL
+    finally:
+        ol.unwatch_foreground()
 
 
 def setup() -> sl.SpotifyClient:
@@ -104,17 +163,18 @@ def load_config():
 
 
 def main():
-    global CFG_MAP
+    global EVENT_HANDLERS
 
     load_config()
 
     cl = setup()
 
-    CFG_MAP = {
+    cfg_map = {
         'set_volume': {'func': cl.set_volume, 'handled_errors': ['Unable to set volume']},
         'play': {'func': cl.play, 'handled_errors': ['Unable to play']},
         'pause': {'func': cl.pause, 'handled_errors': ['Unable to pause']},
     }
+    EVENT_HANDLERS = build_event_handlers(cfg_map)
 
     state_map = {
         GameState.UNKNOWN: 'unknown',
@@ -124,17 +184,26 @@ def main():
     }
 
     print('Running. Press Ctrl+C to quit.')
-    last_state = ol.get_state()
-    logging.info(f'Overwatch: Initial state: {last_state}')
-    handle_event(state_map[last_state])
-    while True:
-        cur_state = ol.get_state()
-        if cur_state != last_state:
-            last_state = cur_state
-            logging.info(f'Overwatch: Changed state: {cur_state}')
+    # Detect states in the background so a slow Spotify request never delays the next check
+    states = queue.Queue(maxsize=1)
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_state, args=(states, stop), name='watch_state', daemon=True)
+    watcher.start()
+    try:
+        while True:
+            try:
+                # Time out periodically so Ctrl+C is handled on Windows
+                cur_state = states.get(timeout=1)
+            except queue.Empty:
+                if not watcher.is_alive():
+                    logging.critical('Overwatch: state detection stopped unexpectedly')
+                    sys.exit(1)
+                continue
             handle_event(state_map[cur_state])
-        time.sleep(1)
-    pass
+    finally:
+        # The screen capture handles are released at exit, so the watcher must be done with them first
+        stop.set()
+        watcher.join()
 
 
 if __name__ == '__main__':